@@ -1,17 +1,26 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Body, Query
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Body, Query, Header
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import ORJSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any, Union
 import uuid
+import orjson
+import time
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from cachetools import TTLCache
+from blake3 import blake3
 import secrets
 from enum import Enum
 
@@ -19,13 +28,20 @@ from enum import Enum
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection: a single client (and connection pool) shared by all handlers
 mongo_url = os.environ.get('MONGO_URL')
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=50,
+    minPoolSize=10,
+    compressors="zstd,zlib",
+    serverSelectionTimeoutMS=3000,
+    uuidRepresentation="standard",
+)
 db = client[os.environ.get('DB_NAME', 'driving_school_db')]
 
 # Create the main app without a prefix
-app = FastAPI(title="Driving School Management API")
+app = FastAPI(title="Driving School Management API", default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -35,9 +51,33 @@ SECRET_KEY = os.environ.get("SECRET_KEY", secrets.token_hex(32))
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# JWT key and decode arguments, built once instead of on every request
+_KEY_BYTES = SECRET_KEY.encode("utf-8")
+_ALGS = (ALGORITHM,)
+_OPTS = {"verify_aud": False, "require_exp": True, "require_sub": True}
+
+# Argon2id for new hashes; bcrypt is kept so existing hashes still verify
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=3,
+    argon2__memory_cost=65536,
+    argon2__parallelism=1,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
+# Dedicated workers for password hashing; bounds how many KDFs run at once
+_HASH_POOL = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+
+# Short-lived cache of resolved users, keyed by a hash of the bearer token.
+# Entries keep the token's exp so an expired token never hits the cache.
+_user_cache = TTLCache(maxsize=5000, ttl=60)
+
+# user id -> teacher id and manager id -> driving school id; these mappings
+# change only when a teacher or school is created, which invalidates them
+_teacher_cache = TTLCache(maxsize=10_000, ttl=300)
+_school_cache = TTLCache(maxsize=10_000, ttl=300)
+
 # Enums
 class UserRole(str, Enum):
     STUDENT = "student"
@@ -72,6 +112,21 @@ class PaymentStatus(str, Enum):
     FAILED = "failed"
     REFUNDED = "refunded"
 
+# List of 58 Algerian states
+ALGERIAN_STATES = (
+    "Adrar", "Chlef", "Laghouat", "Oum El Bouaghi", "Batna", "Béjaïa", "Biskra", "Béchar",
+    "Blida", "Bouira", "Tamanrasset", "Tébessa", "Tlemcen", "Tiaret", "Tizi Ouzou", "Alger",
+    "Djelfa", "Jijel", "Sétif", "Saïda", "Skikda", "Sidi Bel Abbès", "Annaba", "Guelma",
+    "Constantine", "Médéa", "Mostaganem", "M'Sila", "Mascara", "Ouargla", "Oran", "El Bayadh",
+    "Illizi", "Bordj Bou Arréridj", "Boumerdès", "El Tarf", "Tindouf", "Tissemsilt", "El Oued",
+    "Khenchela", "Souk Ahras", "Tipaza", "Mila", "Aïn Defla", "Naâma", "Aïn Témouchent",
+    "Ghardaïa", "Relizane", "Timimoun", "Bordj Badji Mokhtar", "Ouled Djellal", "Béni Abbès",
+    "In Salah", "In Guezzam", "Touggourt", "Djanet", "El M'Ghair", "El Meniaa"
+)
+_VALID_STATES = frozenset(ALGERIAN_STATES)
+_STATES_RESPONSE = {"states": list(ALGERIAN_STATES)}
+_STATES_BODY = orjson.dumps(_STATES_RESPONSE)
+
 # Models
 class UserBase(BaseModel):
     email: EmailStr
@@ -103,6 +158,8 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     user_id: str
     role: str
+    teacher_id: Optional[str] = None
+    school_id: Optional[str] = None
 
 class DrivingSchoolBase(BaseModel):
     name: str
@@ -204,6 +261,10 @@ class Exam(ExamBase):
     class Config:
         orm_mode = True
 
+class ExamPage(BaseModel):
+    items: List[Exam]
+    total: int
+
 class PaymentBase(BaseModel):
     course_id: str
     amount: float
@@ -220,15 +281,99 @@ class Payment(PaymentBase):
     class Config:
         orm_mode = True
 
+class PaymentPage(BaseModel):
+    items: List[Payment]
+    total: int
+
 class StatesList(BaseModel):
     states: List[str]
 
+# Documents store their UUID in _id; the API exposes it as the model's id
+def _doc_values(doc):
+    values = {key: value for key, value in doc.items() if key != "_id"}
+    values["id"] = doc["_id"]
+    return values
+
+# Skips validation, so only for documents this process just dumped from a
+# validated model
+def _from_doc(model, doc):
+    return model.model_construct(**_doc_values(doc))
+
+# Documents read back from Mongo are validated so enum fields are enums again
+def _validated_from_doc(model, doc):
+    return model.model_validate(_doc_values(doc))
+
+# Read endpoints, and the exam/payment writes, hand documents straight to
+# ORJSONResponse instead of building, validating and re-encoding a model
+def _api_doc(doc):
+    doc["id"] = doc.pop("_id")
+    return doc
+
+# Projections that fetch exactly the response-model fields from Mongo
+# (_id is always returned and becomes the model's id)
+def _projection(model):
+    return {field: 1 for field in model.model_fields if field != "id"}
+
+_SCHOOL_PROJ = _projection(DrivingSchool)
+_TEACHER_PROJ = _projection(Teacher)
+_COURSE_PROJ = _projection(Course)
+_SCHEDULE_PROJ = _projection(Schedule)
+_EXAM_PROJ = _projection(Exam)
+_PAYMENT_PROJ = _projection(Payment)
+
+# Course lookups by id made in the same event-loop tick, across concurrent
+# requests, are collected and fetched with a single $in query
+class _CourseLoader:
+    def __init__(self, collection, projection):
+        self._collection = collection
+        self._projection = projection
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._task = None
+
+    def load(self, course_id: str):
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            # The task starts on the next loop iteration, once this tick's
+            # lookups have been queued
+            self._task = loop.create_task(self._dispatch())
+        future = loop.create_future()
+        self._pending.setdefault(course_id, []).append(future)
+        return future
+
+    async def _dispatch(self):
+        batch, self._pending = self._pending, {}
+        try:
+            docs = await self._collection.find(
+                {"_id": {"$in": list(batch)}}, self._projection
+            ).to_list(None)
+        except Exception as exc:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+        found = {doc["_id"]: doc for doc in docs}
+        for course_id, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(found.get(course_id))
+
+# One projection covering every field the batched call sites read
+course_loader = _CourseLoader(db.courses, {"student_id": 1, "teacher_id": 1, "type": 1})
+
 # Authentication functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Hashing is CPU-bound, so run it on the hash pool to keep the event loop free
+async def verify_and_update_password(plain_password, hashed_password):
+    # Returns (verified, new_hash); new_hash is set when the stored hash uses a
+    # deprecated scheme or outdated parameters and should be replaced
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _HASH_POOL, pwd_context.verify_and_update, plain_password, hashed_password
+    )
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_HASH_POOL, pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -237,49 +382,139 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, _KEY_BYTES, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_user_by_email(email: str):
-    user_doc = await db.users.find_one({"email": email})
-    if user_doc:
-        return User(**user_doc)
-    return None
-
 async def authenticate_user(email: str, password: str):
-    user = await get_user_by_email(email)
-    if not user:
-        return False
     user_doc = await db.users.find_one({"email": email})
-    if not verify_password(password, user_doc["password"]):
+    if not user_doc:
         return False
-    return user
+    verified, new_hash = await verify_and_update_password(password, user_doc["password"])
+    if not verified:
+        return False
+    if new_hash:
+        # Move legacy bcrypt hashes to argon2 on the next successful login
+        await db.users.update_one({"_id": user_doc["_id"]}, {"$set": {"password": new_hash}})
+    return _validated_from_doc(User, user_doc)
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def _token_cache_key(token: str) -> bytes:
+    # Cache indexing only; the signature is still verified on a miss
+    return blake3(token.encode()).digest(16)
+
+async def _resolve_token(token: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cache_key = _token_cache_key(token)
+    cached = _user_cache.get(cache_key)
+    if cached is not None:
+        expires_at, user, token_data = cached
+        if time.time() < expires_at:
+            return user, token_data
+        _user_cache.pop(cache_key, None)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, _KEY_BYTES, algorithms=_ALGS, options=_OPTS)
         user_id: str = payload.get("sub")
         role: str = payload.get("role")
         if user_id is None or role is None:
             raise credentials_exception
-        token_data = TokenData(user_id=user_id, role=role)
+        token_data = TokenData(
+            user_id=user_id,
+            role=role,
+            teacher_id=payload.get("teacher_id"),
+            school_id=payload.get("school_id"),
+        )
     except JWTError:
         raise credentials_exception
-    user_doc = await db.users.find_one({"id": token_data.user_id})
+    user_doc = await db.users.find_one({"_id": token_data.user_id})
     if user_doc is None:
         raise credentials_exception
-    return User(**user_doc)
+    user = _validated_from_doc(User, user_doc)
+    _user_cache[cache_key] = (payload["exp"], user, token_data)
+    return user, token_data
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    user, _ = await _resolve_token(token)
+    return user
+
+async def get_token_data(token: str = Depends(oauth2_scheme)):
+    _, token_data = await _resolve_token(token)
+    return token_data
+
+def _validate_state(state: str):
+    if state not in _VALID_STATES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid state"
+        )
+
+def _new_document(payload: BaseModel, **fields):
+    # Dump the validated payload once and add the server-generated fields
+    doc = payload.model_dump()
+    doc["_id"] = str(uuid.uuid4())
+    doc["created_at"] = datetime.utcnow()
+    doc.update(fields)
+    return doc
+
+def pagination_params(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200)
+):
+    return skip, limit
+
+async def _teacher_id_for(user_id: str):
+    if user_id not in _teacher_cache:
+        teacher = await db.teachers.find_one({"user_id": user_id}, {"_id": 1})
+        _teacher_cache[user_id] = teacher["_id"] if teacher else None
+    return _teacher_cache[user_id]
+
+async def _school_id_for(manager_id: str):
+    if manager_id not in _school_cache:
+        school = await db.driving_schools.find_one({"manager_id": manager_id}, {"_id": 1})
+        _school_cache[manager_id] = school["_id"] if school else None
+    return _school_cache[manager_id]
+
+# Role-scoped identifiers are embedded in the token at login; tokens issued
+# before the teacher/school record existed fall back to a lookup.
+async def _scoped_teacher_id(user: User, token_data: TokenData):
+    return token_data.teacher_id or await _teacher_id_for(user.id)
+
+async def _scoped_school_id(user: User, token_data: TokenData):
+    return token_data.school_id or await _school_id_for(user.id)
+
+# Course filters that restrict the list endpoints to the caller's own courses,
+# one handler per role; roles without a handler (admins) see everything
+async def _student_course_scope(user: User, token_data: TokenData):
+    return {"student_id": user.id}
+
+async def _teacher_course_scope(user: User, token_data: TokenData):
+    teacher_id = await _scoped_teacher_id(user, token_data)
+    return {"teacher_id": teacher_id} if teacher_id else {}
+
+async def _manager_course_scope(user: User, token_data: TokenData):
+    school_id = await _scoped_school_id(user, token_data)
+    return {"driving_school_id": school_id} if school_id else {}
+
+ROLE_HANDLERS = {
+    UserRole.STUDENT: _student_course_scope,
+    UserRole.TEACHER: _teacher_course_scope,
+    UserRole.MANAGER: _manager_course_scope,
+}
+
+async def _scope_course_query(user: User, token_data: TokenData):
+    handler = ROLE_HANDLERS.get(user.role)
+    return await handler(user, token_data) if handler else {}
 
 # API Routes
 @api_router.post("/auth/register", response_model=User)
 async def register_user(user: UserCreate):
+    # Reject an invalid state before touching the database
+    _validate_state(user.state)
+    
     # Check if user already exists
-    existing_user = await get_user_by_email(user.email)
+    existing_user = await db.users.find_one({"email": user.email}, {"_id": 1})
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -287,10 +522,9 @@ async def register_user(user: UserCreate):
         )
     
     # Create new user
-    user_dict = user.dict()
-    hashed_password = get_password_hash(user_dict.pop("password"))
-    new_user = User(**user_dict)
-    user_doc = new_user.dict()
+    hashed_password = await get_password_hash(user.password)
+    user_doc = _new_document(user, is_active=True)
+    new_user = _from_doc(User, user_doc)
     user_doc["password"] = hashed_password
     
     await db.users.insert_one(user_doc)
@@ -305,9 +539,19 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    claims = {"sub": user.id, "role": user.role}
+    if user.role == UserRole.TEACHER:
+        teacher_id = await _teacher_id_for(user.id)
+        if teacher_id:
+            claims["teacher_id"] = teacher_id
+    elif user.role == UserRole.MANAGER:
+        school_id = await _school_id_for(user.id)
+        if school_id:
+            claims["school_id"] = school_id
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.id, "role": user.role}, expires_delta=access_token_expires
+        data=claims, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer", "user_id": user.id, "role": user.role}
 
@@ -325,30 +569,43 @@ async def create_driving_school(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only managers and admins can create driving schools"
         )
+    _validate_state(school.state)
     
     # Create new driving school
-    new_school = DrivingSchool(**school.dict())
-    await db.driving_schools.insert_one(new_school.dict())
+    school_doc = _new_document(school, is_active=True)
+    new_school = _from_doc(DrivingSchool, school_doc)
+    await db.driving_schools.insert_one(school_doc)
+    _school_cache.pop(school.manager_id, None)
     return new_school
 
-@api_router.get("/driving-schools", response_model=List[DrivingSchool])
-async def get_driving_schools(state: Optional[str] = None):
+@api_router.get("/driving-schools", response_model=None, responses={200: {"model": List[DrivingSchool]}})
+async def get_driving_schools(
+    state: Optional[str] = None,
+    page: tuple = Depends(pagination_params)
+):
     query = {}
     if state:
+        _validate_state(state)
         query["state"] = state
     
-    schools = await db.driving_schools.find(query).to_list(1000)
-    return [DrivingSchool(**school) for school in schools]
+    skip, limit = page
+    cursor = db.driving_schools.find(query, _SCHOOL_PROJ).sort("created_at", -1).skip(skip).limit(limit)
+    return ORJSONResponse([_api_doc(school) async for school in cursor])
 
-@api_router.get("/driving-schools/{school_id}", response_model=DrivingSchool)
+@api_router.get("/driving-schools/{school_id}", response_model=None, responses={200: {"model": DrivingSchool}})
 async def get_driving_school(school_id: str):
-    school = await db.driving_schools.find_one({"id": school_id})
+    school = await db.driving_schools.find_one({"_id": school_id}, _SCHOOL_PROJ)
     if not school:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Driving school not found"
         )
-    return DrivingSchool(**school)
+    return ORJSONResponse(_api_doc(school))
+
+_TEACHER_GENDER_FLAGS = {
+    Gender.MALE: "has_male_teachers",
+    Gender.FEMALE: "has_female_teachers",
+}
 
 @api_router.post("/teachers", response_model=Teacher)
 async def create_teacher(
@@ -361,8 +618,12 @@ async def create_teacher(
             detail="Only managers and admins can create teachers"
         )
     
+    user, school = await asyncio.gather(
+        db.users.find_one({"_id": teacher.user_id}),
+        db.driving_schools.find_one({"_id": teacher.driving_school_id}),
+    )
+
     # Verify the user exists and is a teacher
-    user = await db.users.find_one({"id": teacher.user_id})
     if not user or user["role"] != UserRole.TEACHER:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -370,7 +631,6 @@ async def create_teacher(
         )
     
     # Verify the driving school exists
-    school = await db.driving_schools.find_one({"id": teacher.driving_school_id})
     if not school:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -378,27 +638,27 @@ async def create_teacher(
         )
     
     # Create new teacher
-    new_teacher = Teacher(**teacher.dict())
-    await db.teachers.insert_one(new_teacher.dict())
-    
-    # Update driving school's teacher gender information
-    if new_teacher.gender == Gender.MALE and not school["has_male_teachers"]:
+    teacher_doc = _new_document(teacher, is_active=True)
+    new_teacher = _from_doc(Teacher, teacher_doc)
+    await db.teachers.insert_one(teacher_doc)
+    _teacher_cache.pop(teacher.user_id, None)
+    
+    # Update driving school's teacher gender information only once the teacher
+    # exists; the filter skips the write server-side when the flag is already set
+    gender_flag = _TEACHER_GENDER_FLAGS.get(new_teacher.gender)
+    if gender_flag:
         await db.driving_schools.update_one(
-            {"id": teacher.driving_school_id},
-            {"$set": {"has_male_teachers": True}}
-        )
-    elif new_teacher.gender == Gender.FEMALE and not school["has_female_teachers"]:
-        await db.driving_schools.update_one(
-            {"id": teacher.driving_school_id},
-            {"$set": {"has_female_teachers": True}}
+            {"_id": teacher.driving_school_id, gender_flag: {"$ne": True}},
+            {"$set": {gender_flag: True}}
         )
     
     return new_teacher
 
-@api_router.get("/teachers", response_model=List[Teacher])
+@api_router.get("/teachers", response_model=None, responses={200: {"model": List[Teacher]}})
 async def get_teachers(
     driving_school_id: Optional[str] = None,
-    gender: Optional[Gender] = None
+    gender: Optional[Gender] = None,
+    page: tuple = Depends(pagination_params)
 ):
     query = {}
     if driving_school_id:
@@ -406,16 +666,53 @@ async def get_teachers(
     if gender:
         query["gender"] = gender
     
-    teachers = await db.teachers.find(query).to_list(1000)
-    return [Teacher(**teacher) for teacher in teachers]
+    skip, limit = page
+    cursor = db.teachers.find(query, _TEACHER_PROJ).sort("created_at", -1).skip(skip).limit(limit)
+    return ORJSONResponse([_api_doc(teacher) async for teacher in cursor])
+
+async def _own_teacher_id(user: User):
+    # The caller's teacher id, looked up only when they act as a teacher
+    if user.role != UserRole.TEACHER:
+        return None
+    return await _teacher_id_for(user.id)
+
+def _course_flag(course_type: CourseType, completed: bool):
+    status_cond = (
+        {"$eq": ["$status", CourseStatus.COMPLETED]}
+        if completed
+        else {"$ne": ["$status", CourseStatus.FAILED]}
+    )
+    return {"$max": {"$cond": [{"$and": [{"$eq": ["$type", course_type]}, status_cond]}, 1, 0]}}
+
+async def _student_course_summary(student_id: str):
+    # One pass over the student's courses for every prerequisite/enrollment check
+    pipeline = [
+        {"$match": {"student_id": student_id}},
+        {"$group": {
+            "_id": None,
+            "completed_code": _course_flag(CourseType.CODE, True),
+            "completed_parking": _course_flag(CourseType.PARKING, True),
+            "active_code": _course_flag(CourseType.CODE, False),
+            "active_parking": _course_flag(CourseType.PARKING, False),
+            "active_road": _course_flag(CourseType.ROAD, False),
+        }},
+    ]
+    rows = await db.courses.aggregate(pipeline).to_list(1)
+    return rows[0] if rows else {}
 
 @api_router.post("/courses", response_model=Course)
 async def create_course(
     course: CourseCreate,
     current_user: User = Depends(get_current_user)
 ):
+    student, teacher, school, summary = await asyncio.gather(
+        db.users.find_one({"_id": course.student_id}),
+        db.teachers.find_one({"_id": course.teacher_id}),
+        db.driving_schools.find_one({"_id": course.driving_school_id}),
+        _student_course_summary(course.student_id),
+    )
+
     # Verify the student exists
-    student = await db.users.find_one({"id": course.student_id})
     if not student or student["role"] != UserRole.STUDENT:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -423,7 +720,6 @@ async def create_course(
         )
     
     # Verify the teacher exists
-    teacher = await db.teachers.find_one({"id": course.teacher_id})
     if not teacher:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -431,7 +727,6 @@ async def create_course(
         )
     
     # Verify the driving school exists
-    school = await db.driving_schools.find_one({"id": course.driving_school_id})
     if not school:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -439,7 +734,7 @@ async def create_course(
         )
     
     # Verify gender matching (male teachers teach male students, female teachers teach female students)
-    teacher_user = await db.users.find_one({"id": teacher["user_id"]})
+    teacher_user = await db.users.find_one({"_id": teacher["user_id"]})
     if teacher_user["gender"] != student["gender"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -449,12 +744,7 @@ async def create_course(
     # For CODE course, no prerequisites
     if course.type == CourseType.CODE:
         # Check if already enrolled in a CODE course
-        existing_code_course = await db.courses.find_one({
-            "student_id": course.student_id,
-            "type": CourseType.CODE,
-            "status": {"$ne": CourseStatus.FAILED}
-        })
-        if existing_code_course:
+        if summary.get("active_code"):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Student already enrolled in a CODE course"
@@ -462,24 +752,14 @@ async def create_course(
     
     # For PARKING course, must have completed CODE course
     elif course.type == CourseType.PARKING:
-        code_course = await db.courses.find_one({
-            "student_id": course.student_id,
-            "type": CourseType.CODE,
-            "status": CourseStatus.COMPLETED
-        })
-        if not code_course:
+        if not summary.get("completed_code"):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Student must complete CODE course before enrolling in PARKING course"
             )
         
         # Check if already enrolled in a PARKING course
-        existing_parking_course = await db.courses.find_one({
-            "student_id": course.student_id,
-            "type": CourseType.PARKING,
-            "status": {"$ne": CourseStatus.FAILED}
-        })
-        if existing_parking_course:
+        if summary.get("active_parking"):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Student already enrolled in a PARKING course"
@@ -487,35 +767,25 @@ async def create_course(
     
     # For ROAD course, must have completed PARKING course
     elif course.type == CourseType.ROAD:
-        parking_course = await db.courses.find_one({
-            "student_id": course.student_id,
-            "type": CourseType.PARKING,
-            "status": CourseStatus.COMPLETED
-        })
-        if not parking_course:
+        if not summary.get("completed_parking"):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Student must complete PARKING course before enrolling in ROAD course"
             )
         
         # Check if already enrolled in a ROAD course
-        existing_road_course = await db.courses.find_one({
-            "student_id": course.student_id,
-            "type": CourseType.ROAD,
-            "status": {"$ne": CourseStatus.FAILED}
-        })
-        if existing_road_course:
+        if summary.get("active_road"):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Student already enrolled in a ROAD course"
             )
     
     # Create new course
-    new_course = Course(**course.dict())
+    google_meet_link = None
     if course.type == CourseType.CODE:
-        new_course.google_meet_link = f"https://meet.google.com/{secrets.token_urlsafe(12)}"
-    
-    await db.courses.insert_one(new_course.dict())
+        google_meet_link = f"https://meet.google.com/{secrets.token_urlsafe(12)}"
+    course_doc = _new_document(course, google_meet_link=google_meet_link)
+    new_course = _from_doc(Course, course_doc)
     
     # For payments - create a pending payment record
     course_price = 0
@@ -526,23 +796,28 @@ async def create_course(
     elif course.type == CourseType.ROAD:
         course_price = school["price_road"]
     
-    payment = Payment(
-        course_id=new_course.id,
-        amount=course_price,
-        status=PaymentStatus.PENDING
+    payment_doc = _new_document(
+        PaymentCreate(course_id=new_course.id, amount=course_price, status=PaymentStatus.PENDING),
+        transaction_id=None
     )
-    await db.payments.insert_one(payment.dict())
+    
+    # The course is written first so a failed insert never leaves behind a
+    # pending payment for a course that does not exist
+    await db.courses.insert_one(course_doc)
+    await db.payments.insert_one(payment_doc)
     
     return new_course
 
-@api_router.get("/courses", response_model=List[Course])
+@api_router.get("/courses", response_model=None, responses={200: {"model": List[Course]}})
 async def get_courses(
     student_id: Optional[str] = None,
     teacher_id: Optional[str] = None,
     driving_school_id: Optional[str] = None,
     type: Optional[CourseType] = None,
     status: Optional[CourseStatus] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    token_data: TokenData = Depends(get_token_data),
+    page: tuple = Depends(pagination_params)
 ):
     query = {}
     
@@ -555,18 +830,18 @@ async def get_courses(
     
     # Teachers can only see their own courses
     if current_user.role == UserRole.TEACHER:
-        teacher = await db.teachers.find_one({"user_id": current_user.id})
-        if teacher:
-            query["teacher_id"] = teacher["id"]
+        scoped_teacher_id = await _scoped_teacher_id(current_user, token_data)
+        if scoped_teacher_id:
+            query["teacher_id"] = scoped_teacher_id
     else:
         if teacher_id:
             query["teacher_id"] = teacher_id
     
     # Managers can only see courses from their driving school
     if current_user.role == UserRole.MANAGER:
-        school = await db.driving_schools.find_one({"manager_id": current_user.id})
-        if school:
-            query["driving_school_id"] = school["id"]
+        scoped_school_id = await _scoped_school_id(current_user, token_data)
+        if scoped_school_id:
+            query["driving_school_id"] = scoped_school_id
     else:
         if driving_school_id:
             query["driving_school_id"] = driving_school_id
@@ -577,8 +852,9 @@ async def get_courses(
     if status:
         query["status"] = status
     
-    courses = await db.courses.find(query).to_list(1000)
-    return [Course(**course) for course in courses]
+    skip, limit = page
+    cursor = db.courses.find(query, _COURSE_PROJ).sort("created_at", -1).skip(skip).limit(limit)
+    return ORJSONResponse([_api_doc(course) async for course in cursor])
 
 @api_router.post("/schedules", response_model=Schedule)
 async def create_schedule(
@@ -592,8 +868,12 @@ async def create_schedule(
             detail="Only managers, teachers, and admins can create schedules"
         )
     
+    course, own_teacher_id = await asyncio.gather(
+        course_loader.load(schedule.course_id),
+        _own_teacher_id(current_user),
+    )
+
     # Verify the course exists
-    course = await db.courses.find_one({"id": schedule.course_id})
     if not course:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -601,7 +881,7 @@ async def create_schedule(
         )
     
     # Get teacher
-    teacher = await db.teachers.find_one({"id": course["teacher_id"]})
+    teacher = await db.teachers.find_one({"_id": course["teacher_id"]})
     if not teacher:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -610,8 +890,7 @@ async def create_schedule(
     
     # Check if the teacher is creating a schedule for their own course
     if current_user.role == UserRole.TEACHER:
-        teacher_record = await db.teachers.find_one({"user_id": current_user.id})
-        if not teacher_record or teacher_record["id"] != course["teacher_id"]:
+        if own_teacher_id != course["teacher_id"]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Teachers can only create schedules for their own courses"
@@ -621,87 +900,142 @@ async def create_schedule(
     schedule_date = schedule.date.replace(minute=0, second=0, microsecond=0)
     end_date = schedule_date + timedelta(minutes=schedule.duration_minutes)
     
-    # Check if the teacher already has a schedule at this time
-    existing_schedule_query = {
-        "date": {
-            "$lt": end_date,
-            "$gte": schedule_date
-        }
-    }
-    
-    # Get all courses taught by this teacher
-    teacher_courses = await db.courses.find({"teacher_id": course["teacher_id"]}).to_list(1000)
-    teacher_course_ids = [c["id"] for c in teacher_courses]
+    day_start = schedule_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_end = day_start + timedelta(days=1)
+    
+    # One pass over the teacher's schedules for the day, driven from the
+    # teacher's courses so schedules are read through the (course_id, date)
+    # index: per course type, how many fall on this day and how many overlap
+    # the requested hour
+    pipeline = [
+        {"$match": {"teacher_id": course["teacher_id"]}},
+        {"$project": {"type": 1}},
+        {"$lookup": {
+            "from": "schedules",
+            "localField": "_id",
+            "foreignField": "course_id",
+            "pipeline": [
+                {"$match": {"date": {"$gte": day_start, "$lt": max(day_end, end_date)}}},
+                {"$project": {"date": 1}},
+            ],
+            "as": "schedule",
+        }},
+        {"$unwind": "$schedule"},
+        {"$group": {
+            "_id": "$type",
+            "day_count": {"$sum": {"$cond": [{"$lt": ["$schedule.date", day_end]}, 1, 0]}},
+            "hour_conflicts": {"$sum": {"$cond": [
+                {"$and": [{"$gte": ["$schedule.date", schedule_date]}, {"$lt": ["$schedule.date", end_date]}]}, 1, 0
+            ]}},
+        }},
+    ]
+    rows = await db.courses.aggregate(pipeline).to_list(None)
+    hour_conflicts = sum(row["hour_conflicts"] for row in rows)
+    day_course_types = {row["_id"]: row["day_count"] for row in rows}
     
-    if teacher_course_ids:
-        existing_schedule_query["course_id"] = {"$in": teacher_course_ids}
+    if course["type"] == CourseType.CODE:
+        # For CODE courses, a teacher can teach 20 students in one hour
+        if hour_conflicts >= 20:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Teacher already has the maximum number of CODE students scheduled for this time"
+            )
+    else:
+        # For PARKING and ROAD courses, a teacher can teach only 1 student per hour
+        # and maximum 3 PARKING and 3 ROAD students per day
+        if hour_conflicts:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Teacher already has a student scheduled for this time"
+            )
         
-        existing_schedules = await db.schedules.find(existing_schedule_query).to_list(1000)
+        # Check daily limit (3 PARKING and 3 ROAD)
+        if course["type"] == CourseType.PARKING and day_course_types.get(CourseType.PARKING, 0) >= 3:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Teacher already has the maximum number of PARKING students scheduled for this day"
+            )
         
-        if course["type"] == CourseType.CODE:
-            # For CODE courses, a teacher can teach 20 students in one hour
-            if len(existing_schedules) >= 20:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Teacher already has the maximum number of CODE students scheduled for this time"
-                )
-        else:
-            # For PARKING and ROAD courses, a teacher can teach only 1 student per hour
-            # and maximum 3 PARKING and 3 ROAD students per day
-            if existing_schedules:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Teacher already has a student scheduled for this time"
-                )
-            
-            # Check daily limit (3 PARKING and 3 ROAD)
-            day_start = schedule_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            
-            day_schedules_query = {
-                "date": {
-                    "$gte": day_start,
-                    "$lt": day_end
-                },
-                "course_id": {"$in": teacher_course_ids}
-            }
-            
-            day_schedules = await db.schedules.find(day_schedules_query).to_list(1000)
-            
-            # Count how many PARKING and ROAD courses are scheduled for this day
-            day_course_types = {}
-            for ds in day_schedules:
-                ds_course = await db.courses.find_one({"id": ds["course_id"]})
-                if ds_course:
-                    course_type = ds_course["type"]
-                    day_course_types[course_type] = day_course_types.get(course_type, 0) + 1
-            
-            if course["type"] == CourseType.PARKING and day_course_types.get(CourseType.PARKING, 0) >= 3:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Teacher already has the maximum number of PARKING students scheduled for this day"
-                )
-            
-            if course["type"] == CourseType.ROAD and day_course_types.get(CourseType.ROAD, 0) >= 3:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Teacher already has the maximum number of ROAD students scheduled for this day"
-                )
+        if course["type"] == CourseType.ROAD and day_course_types.get(CourseType.ROAD, 0) >= 3:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Teacher already has the maximum number of ROAD students scheduled for this day"
+            )
     
     # Create new schedule
-    new_schedule = Schedule(**schedule.dict())
-    await db.schedules.insert_one(new_schedule.dict())
+    schedule_doc = _new_document(schedule)
+    new_schedule = _from_doc(Schedule, schedule_doc)
+    await db.schedules.insert_one(schedule_doc)
     
     return new_schedule
 
-@api_router.get("/schedules", response_model=List[Schedule])
+def _course_scope_pipeline(collection, query, course_query):
+    # Drive the join from the in-scope courses so both sides are read through
+    # their indexes: courses by the scope fields, then the target collection
+    # by course_id; the rest of the query applies to the joined documents
+    course_match = dict(course_query)
+    if "course_id" in query:
+        course_match["_id"] = query["course_id"]
+    return [
+        {"$match": course_match},
+        {"$project": {"_id": 1}},
+        {"$lookup": {
+            "from": collection.name,
+            "localField": "_id",
+            "foreignField": "course_id",
+            "as": "_doc",
+        }},
+        {"$unwind": "$_doc"},
+        {"$replaceRoot": {"newRoot": "$_doc"}},
+        {"$match": query},
+        {"$sort": {"created_at": -1}},
+    ]
+
+async def _find_by_course_scope(collection, query, course_query, projection, page):
+    # Filter documents on fields of their course with a server-side join
+    # rather than first collecting the matching course ids
+    skip, limit = page
+    if not course_query:
+        cursor = collection.find(query, projection).sort("created_at", -1).skip(skip).limit(limit)
+    else:
+        pipeline = _course_scope_pipeline(collection, query, course_query) + [
+            # The cursor is streamed so only `limit` documents are held
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": projection},
+        ]
+        cursor = db.courses.aggregate(pipeline)
+    return ORJSONResponse([_api_doc(doc) async for doc in cursor])
+
+async def _page_by_course_scope(collection, query, course_query, projection, page):
+    # Same filter as _find_by_course_scope, but the page and the total match
+    # count come back from one aggregation through $facet
+    skip, limit = page
+    page_facet = {"$facet": {
+        "items": [{"$skip": skip}, {"$limit": limit}, {"$project": projection}],
+        "total": [{"$count": "n"}],
+    }}
+    if not course_query:
+        cursor = collection.aggregate([{"$match": query}, {"$sort": {"created_at": -1}}, page_facet])
+    else:
+        cursor = db.courses.aggregate(_course_scope_pipeline(collection, query, course_query) + [page_facet])
+    result = await cursor.next()
+    total = result["total"][0]["n"] if result["total"] else 0
+    return ORJSONResponse({
+        "items": [_api_doc(doc) for doc in result["items"]],
+        "total": total,
+    })
+
+@api_router.get("/schedules", response_model=None, responses={200: {"model": List[Schedule]}})
 async def get_schedules(
     course_id: Optional[str] = None,
     student_id: Optional[str] = None,
     teacher_id: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    token_data: TokenData = Depends(get_token_data),
+    page: tuple = Depends(pagination_params)
 ):
     query = {}
     
@@ -726,33 +1060,11 @@ async def get_schedules(
         course_query["teacher_id"] = teacher_id
     
     # Restrict access based on user role
-    if current_user.role == UserRole.STUDENT:
-        course_query["student_id"] = current_user.id
-    elif current_user.role == UserRole.TEACHER:
-        teacher = await db.teachers.find_one({"user_id": current_user.id})
-        if teacher:
-            course_query["teacher_id"] = teacher["id"]
-    elif current_user.role == UserRole.MANAGER:
-        school = await db.driving_schools.find_one({"manager_id": current_user.id})
-        if school:
-            course_query["driving_school_id"] = school["id"]
-    
-    # Get course IDs matching the course query
-    courses = []
-    if course_query:
-        courses = await db.courses.find(course_query).to_list(1000)
-        course_ids = [course["id"] for course in courses]
-        
-        if not course_ids and (student_id or teacher_id or current_user.role in [UserRole.STUDENT, UserRole.TEACHER, UserRole.MANAGER]):
-            return []
-        
-        if course_ids:
-            query["course_id"] = {"$in": course_ids}
+    course_query.update(await _scope_course_query(current_user, token_data))
     
-    schedules = await db.schedules.find(query).to_list(1000)
-    return [Schedule(**schedule) for schedule in schedules]
+    return await _find_by_course_scope(db.schedules, query, course_query, _SCHEDULE_PROJ, page)
 
-@api_router.post("/exams", response_model=Exam)
+@api_router.post("/exams", response_model=None, responses={200: {"model": Exam}})
 async def create_exam(
     exam: ExamCreate,
     current_user: User = Depends(get_current_user)
@@ -764,8 +1076,12 @@ async def create_exam(
             detail="Only managers, teachers, and admins can create exams"
         )
     
+    course, own_teacher_id = await asyncio.gather(
+        course_loader.load(exam.course_id),
+        _own_teacher_id(current_user),
+    )
+
     # Verify the course exists
-    course = await db.courses.find_one({"id": exam.course_id})
     if not course:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -774,23 +1090,22 @@ async def create_exam(
     
     # Check if the teacher is creating an exam for their own course
     if current_user.role == UserRole.TEACHER:
-        teacher = await db.teachers.find_one({"user_id": current_user.id})
-        if not teacher or teacher["id"] != course["teacher_id"]:
+        if own_teacher_id != course["teacher_id"]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Teachers can only create exams for their own courses"
             )
     
     # Create new exam
-    new_exam = Exam(**exam.dict())
-    await db.exams.insert_one(new_exam.dict())
+    exam_doc = _new_document(exam, score=None, feedback=None)
+    await db.exams.insert_one(exam_doc)
     
-    return new_exam
+    return ORJSONResponse(_api_doc(exam_doc))
 
-@api_router.put("/exams/{exam_id}", response_model=Exam)
+@api_router.put("/exams/{exam_id}", response_model=None, responses={200: {"model": Exam}})
 async def update_exam(
     exam_id: str,
-    status: ExamStatus,
+    exam_status: ExamStatus = Query(..., alias="status"),
     score: Optional[float] = None,
     feedback: Optional[str] = None,
     current_user: User = Depends(get_current_user)
@@ -802,8 +1117,12 @@ async def update_exam(
             detail="Only managers, teachers, and admins can update exams"
         )
     
+    exam, own_teacher_id = await asyncio.gather(
+        db.exams.find_one({"_id": exam_id}, {"course_id": 1}),
+        _own_teacher_id(current_user),
+    )
+
     # Verify the exam exists
-    exam = await db.exams.find_one({"id": exam_id})
     if not exam:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -811,7 +1130,7 @@ async def update_exam(
         )
     
     # Verify the course exists
-    course = await db.courses.find_one({"id": exam["course_id"]})
+    course = await course_loader.load(exam["course_id"])
     if not course:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -820,43 +1139,48 @@ async def update_exam(
     
     # Check if the teacher is updating an exam for their own course
     if current_user.role == UserRole.TEACHER:
-        teacher = await db.teachers.find_one({"user_id": current_user.id})
-        if not teacher or teacher["id"] != course["teacher_id"]:
+        if own_teacher_id != course["teacher_id"]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Teachers can only update exams for their own courses"
             )
     
     # Update exam
-    update_data = {"status": status}
+    update_data = {"status": exam_status}
     if score is not None:
         update_data["score"] = score
     if feedback is not None:
         update_data["feedback"] = feedback
     
-    await db.exams.update_one({"id": exam_id}, {"$set": update_data})
+    updated_exam = await db.exams.find_one_and_update(
+        {"_id": exam_id},
+        {"$set": update_data},
+        projection=_EXAM_PROJ,
+        return_document=ReturnDocument.AFTER
+    )
     
     # If exam is passed, update course status
-    if status == ExamStatus.PASSED:
+    if exam_status == ExamStatus.PASSED:
         await db.courses.update_one(
-            {"id": course["id"]},
+            {"_id": course["_id"]},
             {"$set": {"status": CourseStatus.COMPLETED}}
         )
-    elif status == ExamStatus.FAILED:
+    elif exam_status == ExamStatus.FAILED:
         await db.courses.update_one(
-            {"id": course["id"]},
+            {"_id": course["_id"]},
             {"$set": {"status": CourseStatus.FAILED}}
         )
     
-    updated_exam = await db.exams.find_one({"id": exam_id})
-    return Exam(**updated_exam)
+    return ORJSONResponse(_api_doc(updated_exam))
 
-@api_router.get("/exams", response_model=List[Exam])
+@api_router.get("/exams", response_model=None, responses={200: {"model": ExamPage}})
 async def get_exams(
     course_id: Optional[str] = None,
     student_id: Optional[str] = None,
     status: Optional[ExamStatus] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    token_data: TokenData = Depends(get_token_data),
+    page: tuple = Depends(pagination_params)
 ):
     query = {}
     
@@ -874,38 +1198,18 @@ async def get_exams(
         course_query["student_id"] = student_id
     
     # Restrict access based on user role
-    if current_user.role == UserRole.STUDENT:
-        course_query["student_id"] = current_user.id
-    elif current_user.role == UserRole.TEACHER:
-        teacher = await db.teachers.find_one({"user_id": current_user.id})
-        if teacher:
-            course_query["teacher_id"] = teacher["id"]
-    elif current_user.role == UserRole.MANAGER:
-        school = await db.driving_schools.find_one({"manager_id": current_user.id})
-        if school:
-            course_query["driving_school_id"] = school["id"]
-    
-    # Get course IDs matching the course query
-    if course_query:
-        courses = await db.courses.find(course_query).to_list(1000)
-        course_ids = [course["id"] for course in courses]
-        
-        if not course_ids and (student_id or current_user.role in [UserRole.STUDENT, UserRole.TEACHER, UserRole.MANAGER]):
-            return []
-        
-        if course_ids:
-            query["course_id"] = {"$in": course_ids}
+    course_query.update(await _scope_course_query(current_user, token_data))
     
-    exams = await db.exams.find(query).to_list(1000)
-    return [Exam(**exam) for exam in exams]
+    return await _page_by_course_scope(db.exams, query, course_query, _EXAM_PROJ, page)
 
-@api_router.post("/payments", response_model=Payment)
+@api_router.post("/payments", response_model=None, responses={200: {"model": Payment}})
 async def create_payment(
     payment: PaymentCreate,
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
     # Verify the course exists
-    course = await db.courses.find_one({"id": payment.course_id})
+    course = await course_loader.load(payment.course_id)
     if not course:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -920,62 +1224,84 @@ async def create_payment(
         )
     
     # Create new payment
-    new_payment = Payment(**payment.dict())
-    new_payment.transaction_id = f"TXN-{secrets.token_hex(8)}"
-    await db.payments.insert_one(new_payment.dict())
+    payment_doc = _new_document(payment, transaction_id="TXN-" + secrets.token_bytes(8).hex())
+    if not idempotency_key:
+        await db.payments.insert_one(payment_doc)
+        return ORJSONResponse(_api_doc(payment_doc))
+    
+    # A retry carrying the same Idempotency-Key gets back the payment the first
+    # attempt created; the unique index keeps concurrent retries to one insert
+    key_filter = {"idempotency_key": idempotency_key}
+    try:
+        created_payment = await db.payments.find_one_and_update(
+            key_filter,
+            {"$setOnInsert": payment_doc},
+            projection=_PAYMENT_PROJ,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent request with the same key inserted first
+        created_payment = await db.payments.find_one(key_filter, _PAYMENT_PROJ)
     
-    return new_payment
+    if created_payment["course_id"] != payment.course_id or created_payment["amount"] != payment.amount:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Idempotency key already used for a different payment"
+        )
+    
+    return ORJSONResponse(_api_doc(created_payment))
 
-@api_router.put("/payments/{payment_id}", response_model=Payment)
+@api_router.put("/payments/{payment_id}", response_model=None, responses={200: {"model": Payment}})
 async def update_payment(
     payment_id: str,
-    status: PaymentStatus,
+    payment_status: PaymentStatus = Query(..., alias="status"),
     current_user: User = Depends(get_current_user)
 ):
-    # Verify the payment exists
-    payment = await db.payments.find_one({"id": payment_id})
-    if not payment:
+    # Only the student associated with the course, managers, or admins can update
+    # payments; the check is part of the update filter so it happens atomically
+    payment_filter = {"_id": payment_id}
+    if current_user.role != UserRole.ADMIN and current_user.role != UserRole.MANAGER:
+        own_courses = await db.courses.find({"student_id": current_user.id}, {"_id": 1}).to_list(None)
+        payment_filter["course_id"] = {"$in": [c["_id"] for c in own_courses]}
+    
+    # Update payment, getting the updated document back in the same round-trip
+    updated_payment = await db.payments.find_one_and_update(
+        payment_filter,
+        {"$set": {"status": payment_status}},
+        projection=_PAYMENT_PROJ,
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated_payment:
+        # Only the failure path pays for telling a missing payment from a forbidden one
+        if await db.payments.find_one({"_id": payment_id}, {"_id": 1}):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only update payments for your own courses"
+            )
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Payment not found"
         )
     
-    # Verify the course exists
-    course = await db.courses.find_one({"id": payment["course_id"]})
-    if not course:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Course not found"
-        )
-    
-    # Only the student associated with the course, managers, or admins can update payments
-    if (current_user.role != UserRole.ADMIN and 
-        current_user.role != UserRole.MANAGER and 
-        current_user.id != course["student_id"]):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only update payments for your own courses"
-        )
-    
-    # Update payment
-    await db.payments.update_one({"id": payment_id}, {"$set": {"status": status}})
-    
-    # If payment is completed, update course status to in progress
-    if status == PaymentStatus.COMPLETED and course["status"] == CourseStatus.NOT_STARTED:
+    # If payment is completed, update course status to in progress; the filter
+    # only matches a course that has not started yet
+    if payment_status == PaymentStatus.COMPLETED:
         await db.courses.update_one(
-            {"id": course["id"]},
+            {"_id": updated_payment["course_id"], "status": CourseStatus.NOT_STARTED},
             {"$set": {"status": CourseStatus.IN_PROGRESS}}
         )
     
-    updated_payment = await db.payments.find_one({"id": payment_id})
-    return Payment(**updated_payment)
+    return ORJSONResponse(_api_doc(updated_payment))
 
-@api_router.get("/payments", response_model=List[Payment])
+@api_router.get("/payments", response_model=None, responses={200: {"model": PaymentPage}})
 async def get_payments(
     course_id: Optional[str] = None,
     student_id: Optional[str] = None,
     status: Optional[PaymentStatus] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    token_data: TokenData = Depends(get_token_data),
+    page: tuple = Depends(pagination_params)
 ):
     query = {}
     
@@ -993,45 +1319,14 @@ async def get_payments(
         course_query["student_id"] = student_id
     
     # Restrict access based on user role
-    if current_user.role == UserRole.STUDENT:
-        course_query["student_id"] = current_user.id
-    elif current_user.role == UserRole.TEACHER:
-        teacher = await db.teachers.find_one({"user_id": current_user.id})
-        if teacher:
-            course_query["teacher_id"] = teacher["id"]
-    elif current_user.role == UserRole.MANAGER:
-        school = await db.driving_schools.find_one({"manager_id": current_user.id})
-        if school:
-            course_query["driving_school_id"] = school["id"]
-    
-    # Get course IDs matching the course query
-    if course_query:
-        courses = await db.courses.find(course_query).to_list(1000)
-        course_ids = [course["id"] for course in courses]
-        
-        if not course_ids and (student_id or current_user.role in [UserRole.STUDENT, UserRole.TEACHER, UserRole.MANAGER]):
-            return []
-        
-        if course_ids:
-            query["course_id"] = {"$in": course_ids}
+    course_query.update(await _scope_course_query(current_user, token_data))
     
-    payments = await db.payments.find(query).to_list(1000)
-    return [Payment(**payment) for payment in payments]
+    return await _page_by_course_scope(db.payments, query, course_query, _PAYMENT_PROJ, page)
 
 @api_router.get("/states", response_model=StatesList)
 async def get_states():
-    # List of 58 Algerian states
-    algeria_states = [
-        "Adrar", "Chlef", "Laghouat", "Oum El Bouaghi", "Batna", "Béjaïa", "Biskra", "Béchar", 
-        "Blida", "Bouira", "Tamanrasset", "Tébessa", "Tlemcen", "Tiaret", "Tizi Ouzou", "Alger", 
-        "Djelfa", "Jijel", "Sétif", "Saïda", "Skikda", "Sidi Bel Abbès", "Annaba", "Guelma", 
-        "Constantine", "Médéa", "Mostaganem", "M'Sila", "Mascara", "Ouargla", "Oran", "El Bayadh", 
-        "Illizi", "Bordj Bou Arréridj", "Boumerdès", "El Tarf", "Tindouf", "Tissemsilt", "El Oued", 
-        "Khenchela", "Souk Ahras", "Tipaza", "Mila", "Aïn Defla", "Naâma", "Aïn Témouchent", 
-        "Ghardaïa", "Relizane", "Timimoun", "Bordj Badji Mokhtar", "Ouled Djellal", "Béni Abbès", 
-        "In Salah", "In Guezzam", "Touggourt", "Djanet", "El M'Ghair", "El Meniaa"
-    ]
-    return {"states": algeria_states}
+    # The body never changes, so it is serialized once at import
+    return Response(content=_STATES_BODY, media_type="application/json")
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -1039,9 +1334,11 @@ app.include_router(api_router)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # FRONTEND_URL may list several comma-separated origins
+    allow_origins=[origin.strip() for origin in os.environ.get('FRONTEND_URL', '').split(',') if origin.strip()],
+    allow_methods=["GET", "POST", "PUT"],
+    allow_headers=["Authorization", "Content-Type", "Idempotency-Key"],
+    max_age=86400,
 )
 
 # Configure logging
@@ -1051,6 +1348,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def warm_db_pool():
+    # Open the first pooled connection before serving requests
+    await db.command("ping")
+
+@app.on_event("startup")
+async def check_id_migration():
+    # Documents keep their UUID in _id; refuse to serve a database that still
+    # holds ObjectId _ids, which would surface as 404s and 500s at runtime
+    for collection in (db.users, db.driving_schools, db.teachers, db.courses, db.schedules, db.exams, db.payments):
+        if await collection.find_one({"_id": {"$type": "objectId"}}, {"_id": 1}):
+            raise RuntimeError(
+                f"Collection {collection.name!r} has documents with ObjectId _ids; "
+                "run scripts/migrate_uuid_ids.py before starting the server"
+            )
+
+@app.on_event("startup")
+async def ensure_indexes():
+    # create_index is a no-op when the index already exists
+    await db.users.create_index("email", unique=True)
+    await db.teachers.create_index("user_id")
+    await db.teachers.create_index("driving_school_id")
+    await db.driving_schools.create_index("manager_id")
+    await db.driving_schools.create_index("state")
+    await db.courses.create_index([("student_id", 1), ("type", 1), ("status", 1)])
+    await db.courses.create_index("teacher_id")
+    await db.courses.create_index("driving_school_id")
+    await db.schedules.create_index([("course_id", 1), ("date", 1)])
+    await db.exams.create_index("course_id")
+    await db.payments.create_index([("course_id", 1), ("status", 1)])
+    await db.payments.create_index(
+        "idempotency_key",
+        unique=True,
+        partialFilterExpression={"idempotency_key": {"$type": "string"}}
+    )
+    # Backs the created_at sort used by the paginated list endpoints
+    for collection in (db.driving_schools, db.teachers, db.courses, db.schedules, db.exams, db.payments):
+        await collection.create_index([("created_at", -1)])
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    _HASH_POOL.shutdown(wait=False)
@@ -1,13 +1,37 @@
 
-import requests
+import asyncio
+import httpx
+import logging
+import os
 import sys
 import random
-import string
-from datetime import datetime
+import time
+
+# Passing tests log at INFO and are silent by default; set TEST_LOG_LEVEL=INFO
+# to see them. Each test emits one record so concurrent tests don't interleave
+logger = logging.getLogger("backend_test")
+
+def json_body(response):
+    """Decode a JSON response body, or return None for any other content type"""
+    if response.headers.get("content-type", "").startswith("application/json"):
+        return response.json()
+    return None
+
+def error_detail(response):
+    body = json_body(response)
+    if isinstance(body, dict):
+        return f"Error detail: {body.get('detail', 'No detail provided')}"
+    return "Could not parse error response"
 
 class DrivingSchoolAPITester:
     def __init__(self, base_url="https://5cd520e4-32b7-472c-8639-0c2a419f5076.preview.emergentagent.com/api"):
         self.base_url = base_url
+        # One pooled HTTP/2 client for the whole run
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=True,
+            headers={'Content-Type': 'application/json'}
+        )
         self.token = None
         self.user_id = None
         self.user_role = None
@@ -15,57 +39,55 @@ class DrivingSchoolAPITester:
         self.tests_passed = 0
         self.test_data = {}
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, params=None):
-        """Run a single API test"""
-        url = f"{self.base_url}/{endpoint}"
-        headers = {'Content-Type': 'application/json'}
-        if self.token:
-            headers['Authorization'] = f'Bearer {self.token}'
+    async def close(self):
+        await self.client.aclose()
 
+    async def run_test(self, name, method, endpoint, expected_status, data=None, params=None):
+        """Run a single API test"""
         self.tests_run += 1
-        print(f"\n🔍 Testing {name}...")
         
         try:
             if method == 'GET':
-                response = requests.get(url, headers=headers, params=params)
+                response = await self.client.get(endpoint, params=params)
             elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers)
+                response = await self.client.post(endpoint, json=data)
             elif method == 'PUT':
-                response = requests.put(url, json=data, headers=headers)
+                response = await self.client.put(endpoint, json=data)
 
             success = response.status_code == expected_status
             if success:
                 self.tests_passed += 1
-                print(f"✅ Passed - Status: {response.status_code}")
-                try:
-                    return success, response.json()
-                except:
-                    return success, {}
+                logger.info("🔍 Testing %s... ✅ Passed - Status: %s", name, response.status_code)
+                body = json_body(response)
+                return success, body if body is not None else {}
             else:
-                print(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
-                try:
-                    error_detail = response.json().get('detail', 'No detail provided')
-                    print(f"Error detail: {error_detail}")
-                except:
-                    print("Could not parse error response")
+                logger.warning(
+                    "🔍 Testing %s... ❌ Failed - Expected %s, got %s\n%s",
+                    name, expected_status, response.status_code, error_detail(response)
+                )
                 return False, {}
 
         except Exception as e:
-            print(f"❌ Failed - Error: {str(e)}")
+            logger.warning("🔍 Testing %s... ❌ Failed - Error: %s", name, e)
             return False, {}
 
     def generate_test_data(self):
         """Generate random test data for user registration"""
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        random_str = ''.join(random.choices(string.ascii_lowercase, k=5))
+        timestamp = time.time_ns()
+        random_str = os.urandom(4).hex()
+        # One draw per field group, offset into each field's range below
+        phone = random.sample(range(100_000_000), 4)
+        addr = random.sample(range(1, 101), 4)
+        price = random.sample(range(5001), 3)
+        lic = random.randrange(10000, 100000)
         
         self.test_data = {
             "student": {
                 "email": f"student_{random_str}_{timestamp}@test.com",
                 "full_name": f"Test Student {random_str}",
-                "phone": f"+213{random.randint(500000000, 599999999)}",
+                "phone": f"+213{500000000 + phone[0]}",
                 "gender": "male",
-                "address": f"{random.randint(1, 100)} Test Street",
+                "address": f"{addr[0]} Test Street",
                 "state": "Alger",
                 "password": "Test123!",
                 "role": "student"
@@ -73,9 +95,9 @@ class DrivingSchoolAPITester:
             "teacher": {
                 "email": f"teacher_{random_str}_{timestamp}@test.com",
                 "full_name": f"Test Teacher {random_str}",
-                "phone": f"+213{random.randint(600000000, 699999999)}",
+                "phone": f"+213{600000000 + phone[1]}",
                 "gender": "male",
-                "address": f"{random.randint(1, 100)} Teacher Street",
+                "address": f"{addr[1]} Teacher Street",
                 "state": "Alger",
                 "password": "Test123!",
                 "role": "teacher"
@@ -83,9 +105,9 @@ class DrivingSchoolAPITester:
             "manager": {
                 "email": f"manager_{random_str}_{timestamp}@test.com",
                 "full_name": f"Test Manager {random_str}",
-                "phone": f"+213{random.randint(700000000, 799999999)}",
+                "phone": f"+213{700000000 + phone[2]}",
                 "gender": "male",
-                "address": f"{random.randint(1, 100)} Manager Street",
+                "address": f"{addr[2]} Manager Street",
                 "state": "Alger",
                 "password": "Test123!",
                 "role": "manager"
@@ -93,36 +115,36 @@ class DrivingSchoolAPITester:
             "driving_school": {
                 "name": f"Test Driving School {random_str}",
                 "description": "A test driving school for API testing",
-                "address": f"{random.randint(1, 100)} School Street",
+                "address": f"{addr[3]} School Street",
                 "state": "Alger",
                 "city": "Algiers",
-                "phone": f"+213{random.randint(800000000, 899999999)}",
+                "phone": f"+213{800000000 + phone[3]}",
                 "email": f"school_{random_str}_{timestamp}@test.com",
-                "license_number": f"LIC-{random.randint(10000, 99999)}",
-                "price_code": random.randint(5000, 10000),
-                "price_parking": random.randint(10000, 20000),
-                "price_road": random.randint(15000, 30000),
+                "license_number": f"LIC-{lic}",
+                "price_code": 5000 + price[0],
+                "price_parking": 10000 + 2 * price[1],
+                "price_road": 15000 + 3 * price[2],
                 "has_female_teachers": False,
                 "has_male_teachers": True
             }
         }
 
-    def test_get_states(self):
+    async def test_get_states(self):
         """Test getting the list of states"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Get States",
             "GET",
             "states",
             200
         )
         if success and 'states' in response:
-            print(f"Retrieved {len(response['states'])} states")
+            logger.info("Retrieved %d states", len(response['states']))
             return True
         return False
 
-    def test_register_user(self, user_type):
+    async def test_register_user(self, user_type):
         """Test user registration"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             f"Register {user_type}",
             "POST",
             "auth/register",
@@ -130,7 +152,7 @@ class DrivingSchoolAPITester:
             data=self.test_data[user_type]
         )
         if success and 'id' in response:
-            print(f"{user_type.capitalize()} registered with ID: {response['id']}")
+            logger.info("%s registered with ID: %s", user_type.capitalize(), response['id'])
             if user_type == "student":
                 self.test_data["student_id"] = response['id']
             elif user_type == "teacher":
@@ -140,21 +162,20 @@ class DrivingSchoolAPITester:
             return True
         return False
 
-    def test_login(self, user_type):
+    async def test_login(self, user_type):
         """Test login and get token"""
         # For login, we need to use form data instead of JSON
-        url = f"{self.base_url}/auth/token"
         form_data = {
             "username": self.test_data[user_type]["email"],
             "password": self.test_data[user_type]["password"]
         }
         
         self.tests_run += 1
-        print(f"\n🔍 Testing Login as {user_type}...")
+        name = f"Login as {user_type}"
         
         try:
-            response = requests.post(
-                url, 
+            response = await self.client.post(
+                "auth/token",
                 data=form_data,
                 headers={'Content-Type': 'application/x-www-form-urlencoded'}
             )
@@ -162,46 +183,47 @@ class DrivingSchoolAPITester:
             success = response.status_code == 200
             if success:
                 self.tests_passed += 1
-                print(f"✅ Passed - Status: {response.status_code}")
                 response_data = response.json()
                 self.token = response_data['access_token']
+                self.client.headers['Authorization'] = f'Bearer {self.token}'
                 self.user_id = response_data['user_id']
                 self.user_role = response_data['role']
-                print(f"Logged in as {user_type} with role: {self.user_role}")
+                logger.info(
+                    "🔍 Testing %s... ✅ Passed - Status: %s\nLogged in as %s with role: %s",
+                    name, response.status_code, user_type, self.user_role
+                )
                 return True
             else:
-                print(f"❌ Failed - Expected 200, got {response.status_code}")
-                try:
-                    error_detail = response.json().get('detail', 'No detail provided')
-                    print(f"Error detail: {error_detail}")
-                except:
-                    print("Could not parse error response")
+                logger.warning(
+                    "🔍 Testing %s... ❌ Failed - Expected 200, got %s\n%s",
+                    name, response.status_code, error_detail(response)
+                )
                 return False
                 
         except Exception as e:
-            print(f"❌ Failed - Error: {str(e)}")
+            logger.warning("🔍 Testing %s... ❌ Failed - Error: %s", name, e)
             return False
 
-    def test_get_user_profile(self):
+    async def test_get_user_profile(self):
         """Test getting user profile"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Get User Profile",
             "GET",
             "users/me",
             200
         )
         if success and 'id' in response:
-            print(f"Retrieved profile for user: {response['full_name']}")
+            logger.info("Retrieved profile for user: %s", response['full_name'])
             return True
         return False
 
-    def test_register_driving_school(self):
+    async def test_register_driving_school(self):
         """Test registering a driving school"""
         # Add manager_id to the driving school data
         school_data = self.test_data["driving_school"].copy()
         school_data["manager_id"] = self.user_id
         
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Register Driving School",
             "POST",
             "driving-schools",
@@ -211,15 +233,15 @@ class DrivingSchoolAPITester:
         
         if success and 'id' in response:
             self.test_data["school_id"] = response['id']
-            print(f"Driving school registered with ID: {response['id']}")
+            logger.info("Driving school registered with ID: %s", response['id'])
             return True
         return False
 
-    def test_get_driving_schools(self, state=None):
+    async def test_get_driving_schools(self, state=None):
         """Test getting list of driving schools"""
         params = {"state": state} if state else None
         
-        success, response = self.run_test(
+        success, response = await self.run_test(
             f"Get Driving Schools{' in ' + state if state else ''}",
             "GET",
             "driving-schools",
@@ -228,17 +250,17 @@ class DrivingSchoolAPITester:
         )
         
         if success:
-            print(f"Retrieved {len(response)} driving schools")
+            logger.info("Retrieved %d driving schools", len(response))
             return True
         return False
 
-    def test_get_driving_school_by_id(self):
+    async def test_get_driving_school_by_id(self):
         """Test getting a specific driving school by ID"""
         if "school_id" not in self.test_data:
-            print("❌ No school ID available for testing")
+            logger.error("❌ No school ID available for testing")
             return False
             
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Get Driving School by ID",
             "GET",
             f"driving-schools/{self.test_data['school_id']}",
@@ -246,64 +268,76 @@ class DrivingSchoolAPITester:
         )
         
         if success and 'id' in response:
-            print(f"Retrieved driving school: {response['name']}")
+            logger.info("Retrieved driving school: %s", response['name'])
             return True
         return False
 
-def main():
+async def main():
     # Setup
     tester = DrivingSchoolAPITester()
     tester.generate_test_data()
-    
-    # Test 1: Get states
-    if not tester.test_get_states():
-        print("❌ Failed to get states, stopping tests")
+    try:
+        return await run_tests(tester)
+    finally:
+        await tester.close()
+
+async def run_tests(tester):
+    # Tests 1-2: Get states and register the users; these are independent
+    # and none needs a token, so they run concurrently
+    states_ok, student_ok, manager_ok, teacher_ok = await asyncio.gather(
+        tester.test_get_states(),
+        tester.test_register_user("student"),
+        tester.test_register_user("manager"),
+        tester.test_register_user("teacher"),
+    )
+    if not states_ok:
+        logger.error("❌ Failed to get states, stopping tests")
         return 1
-    
-    # Test 2: Register a student
-    if not tester.test_register_user("student"):
-        print("❌ Student registration failed, stopping tests")
+    if not student_ok:
+        logger.error("❌ Student registration failed, stopping tests")
         return 1
+    if not teacher_ok:
+        logger.error("❌ Teacher registration failed")
     
     # Test 3: Login as student
-    if not tester.test_login("student"):
-        print("❌ Student login failed, stopping tests")
+    if not await tester.test_login("student"):
+        logger.error("❌ Student login failed, stopping tests")
         return 1
     
     # Test 4: Get student profile
-    if not tester.test_get_user_profile():
-        print("❌ Getting student profile failed")
+    if not await tester.test_get_user_profile():
+        logger.error("❌ Getting student profile failed")
     
-    # Test 5: Register a manager
-    tester.token = None  # Clear token to register as a new user
-    if not tester.test_register_user("manager"):
-        print("❌ Manager registration failed, stopping tests")
+    # Test 5: Manager was registered alongside the student
+    if not manager_ok:
+        logger.error("❌ Manager registration failed, stopping tests")
         return 1
     
     # Test 6: Login as manager
-    if not tester.test_login("manager"):
-        print("❌ Manager login failed, stopping tests")
+    if not await tester.test_login("manager"):
+        logger.error("❌ Manager login failed, stopping tests")
         return 1
     
     # Test 7: Register a driving school
-    if not tester.test_register_driving_school():
-        print("❌ Driving school registration failed")
+    if not await tester.test_register_driving_school():
+        logger.error("❌ Driving school registration failed")
     
     # Test 8: Get driving schools (all)
-    if not tester.test_get_driving_schools():
-        print("❌ Getting driving schools failed")
+    if not await tester.test_get_driving_schools():
+        logger.error("❌ Getting driving schools failed")
     
     # Test 9: Get driving schools by state
-    if not tester.test_get_driving_schools("Alger"):
-        print("❌ Getting driving schools by state failed")
+    if not await tester.test_get_driving_schools("Alger"):
+        logger.error("❌ Getting driving schools by state failed")
     
     # Test 10: Get driving school by ID
-    if not tester.test_get_driving_school_by_id():
-        print("❌ Getting driving school by ID failed")
+    if not await tester.test_get_driving_school_by_id():
+        logger.error("❌ Getting driving school by ID failed")
     
     # Print results
     print(f"\n📊 Tests passed: {tester.tests_passed}/{tester.tests_run}")
     return 0 if tester.tests_passed == tester.tests_run else 1
 
 if __name__ == "__main__":
-    sys.exit(main())
+    logging.basicConfig(level=os.environ.get("TEST_LOG_LEVEL", "WARNING"), format="%(message)s")
+    sys.exit(asyncio.run(main()))
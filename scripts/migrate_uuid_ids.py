@@ -0,0 +1,60 @@
+"""One-off migration: move each document's UUID `id` field into `_id`.
+
+Documents written before the API started storing its UUIDs in `_id` carry a
+Mongo-generated ObjectId `_id` plus a string `id`. References between
+collections (user_id, course_id, ...) already hold those UUID strings, so
+only the documents themselves need rewriting.
+
+Each collection is rewritten through an aggregation `$out` into a temporary
+collection, which is then renamed over the original, so a collection is
+either fully migrated or untouched. Indexes are recreated by the server's
+startup hook. Running the script again is a no-op.
+
+Usage: python scripts/migrate_uuid_ids.py  (reads backend/.env)
+"""
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / 'backend' / '.env')
+
+COLLECTIONS = ("users", "driving_schools", "teachers", "courses", "schedules", "exams", "payments")
+
+def migrate_collection(db, name):
+    collection = db[name]
+    legacy = collection.count_documents({"_id": {"$type": "objectId"}})
+    if not legacy:
+        print(f"{name}: nothing to migrate")
+        return
+
+    temp_name = f"{name}__uuid_migration"
+    db.drop_collection(temp_name)
+    collection.aggregate([
+        # Legacy documents take their UUID from `id`; a document without one
+        # keeps its ObjectId as a string
+        {"$set": {"_id": {"$cond": [
+            {"$eq": [{"$type": "$_id"}, "objectId"]},
+            {"$ifNull": ["$id", {"$toString": "$_id"}]},
+            "$_id",
+        ]}}},
+        {"$unset": "id"},
+        {"$out": temp_name},
+    ])
+    db[temp_name].rename(name, dropTarget=True)
+    print(f"{name}: migrated {legacy} documents")
+
+def main():
+    client = MongoClient(os.environ['MONGO_URL'], uuidRepresentation="standard")
+    db = client[os.environ.get('DB_NAME', 'driving_school_db')]
+    existing = set(db.list_collection_names())
+    for name in COLLECTIONS:
+        if name in existing:
+            migrate_collection(db, name)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())